@@ -1,9 +1,18 @@
+import io
+import os
 import sys
-import struct
+import mmap
+import shutil
 import signal
+import tempfile
+import contextlib
+from itertools import compress, repeat
 
-# Handle broken pipes (e.g., when piping to head)
-signal.signal(signal.SIGPIPE, signal.SIG_DFL)
+class DROError(Exception):
+    """Raised when a file is not a supported DRO file."""
+
+# Channel map for operator offsets (255 = no channel)
+_OP_CH_MAP = bytes([0, 1, 2, 0, 1, 2, 255, 255, 3, 4, 5, 3, 4, 5, 255, 255, 6, 7, 8, 6, 7, 8])
 
 def get_channel_from_reg(bank, reg):
     """
@@ -33,181 +42,98 @@ def get_channel_from_reg(bank, reg):
         offset = reg % 0x20 # Get low 5 bits effectively
         if offset > 0x15: return -1 # Should not happen based on ranges above
         
-        # Channel map for operator offsets
-        op_ch_map = [0, 1, 2, 0, 1, 2, -1, -1, 3, 4, 5, 3, 4, 5, -1, -1, 6, 7, 8, 6, 7, 8]
-        if offset < len(op_ch_map):
-            ch_offset = op_ch_map[offset]
-            if ch_offset != -1:
+        if offset < len(_OP_CH_MAP):
+            ch_offset = _OP_CH_MAP[offset]
+            if ch_offset != 255:
                 return base_ch + ch_offset
                 
     return -1
 
-def remove_channel(filename, target_channel, output_filename):
-    with open(filename, 'rb') as f:
-        data = f.read()
+# Channel lookup table indexed by (bank << 8) | reg.
+# Entries hold channel + 1, so 0 means "not channel-specific". Global
+# registers such as rhythm control (0xBD) are 0 in both banks.
+CH_LUT = bytes([(get_channel_from_reg(b, r) + 1) & 0xFF for b in (0, 1) for r in range(256)])
 
-    if data[0:8] != b'DBRAWOPL':
-        print("Error: Not a valid DRO file")
-        return
+# Dump description kinds
+DESC_NONE = 0    # Not shown in the dump
+DESC_STATIC = 1  # Description does not depend on the value
+DESC_KEYON = 2
+DESC_F_LOW = 3
+DESC_CONN = 4
+DESC_LEVEL = 5
 
-    ver_major = struct.unpack('<H', data[8:10])[0]
-    if ver_major != 2:
-        print("Error: Only DRO v2.0 is supported")
-        return
-
-    short_delay_code = data[23]
-    long_delay_code = data[24]
-    codemap_len = data[25]
-    codemap_start = 26
-    
-    codemap = data[codemap_start : codemap_start + codemap_len]
-    
-    # Start writing output
-    out_data = bytearray()
-    
-    # 1. Copy Header and Codemap verbatim
-    stream_start = codemap_start + codemap_len
-    out_data.extend(data[:stream_start])
-    
-    # 2. Process Stream
-    i = stream_start
-    dropped_commands = 0
+def get_desc_kind(reg):
+    """
+    Returns (kind, prefix) describing how dump_dro renders a register write.
+    prefix is the value-independent start of the description.
+    """
+    # B0-B8: KeyOn / Block / FreqHigh
+    if 0xB0 <= reg <= 0xB8:
+        return DESC_KEYON, f"CH {reg - 0xB0}"
     
-    while i < len(data):
-        code = data[i]
-        i += 1
-        
-        # Delay Codes - Copy unchanged
-        if code == short_delay_code or code == long_delay_code:
-            val = data[i]
-            i += 1
-            out_data.append(code)
-            out_data.append(val)
-            continue
-            
-        # Register Write
-        val = data[i]
-        i += 1
+    # A0-A8: FreqLow
+    if 0xA0 <= reg <= 0xA8:
+        return DESC_F_LOW, f"CH {reg - 0xA0}"
         
-        bank = (code >> 7) & 1
-        idx = code & 0x7F
-        
-        if idx >= len(codemap):
-            # Invalid index, just copy it to be safe
-            out_data.append(code)
-            out_data.append(val)
-            continue
-            
-        reg = codemap[idx]
-        ch = get_channel_from_reg(bank, reg)
+    # C0-C8: Feedback / Connection (Algorithm)
+    if 0xC0 <= reg <= 0xC8:
+        return DESC_CONN, f"CH {reg - 0xC0}"
         
-        if ch == target_channel:
-            dropped_commands += 1
-            # Do NOT append to out_data
-        else:
-            out_data.append(code)
-            out_data.append(val)
+    # 20-35: Tremolo / Vibrato / Sustain / KSR / Multiplier
+    if 0x20 <= reg <= 0x35:
+        return DESC_STATIC, f"OP-Reg {reg:02X} | TVSKM"
 
-    with open(output_filename, 'wb') as f_out:
-        f_out.write(out_data)
+    # 40-55: KSL / Level
+    if 0x40 <= reg <= 0x55:
+        return DESC_LEVEL, f"OP-Reg {reg:02X}"
         
-    print(f"Removed Channel {target_channel}.")
-    print(f"Dropped {dropped_commands} commands.")
-    print(f"Saved to {output_filename}")
-
-def isolate_channel(filename, target_channel, output_filename):
-    with open(filename, 'rb') as f:
-        data = f.read()
+    # BD: Rhythm
+    if reg == 0xBD:
+        return DESC_STATIC, "Rhythm Control"
 
-    if data[0:8] != b'DBRAWOPL':
-        print("Error: Not a valid DRO file")
-        return
+    return DESC_NONE, ""
 
-    ver_major = struct.unpack('<H', data[8:10])[0]
-    if ver_major != 2:
-        print("Error: Only DRO v2.0 is supported")
-        return
+# Description lookup table indexed by reg
+DESC_TABLE = [get_desc_kind(r) for r in range(256)]
 
-    short_delay_code = data[23]
-    long_delay_code = data[24]
-    codemap_len = data[25]
-    codemap_start = 26
-    
-    codemap = data[codemap_start : codemap_start + codemap_len]
-    
-    # Start writing output
-    out_data = bytearray()
-    
-    # 1. Copy Header and Codemap verbatim
-    stream_start = codemap_start + codemap_len
-    out_data.extend(data[:stream_start])
-    
-    # 2. Process Stream
-    i = stream_start
-    dropped_commands = 0
-    
-    while i < len(data):
-        code = data[i]
-        i += 1
-        
-        # Delay Codes - Copy unchanged
-        if code == short_delay_code or code == long_delay_code:
-            val = data[i]
-            i += 1
-            out_data.append(code)
-            out_data.append(val)
-            continue
-            
-        # Register Write
-        val = data[i]
-        i += 1
-        
-        bank = (code >> 7) & 1
-        idx = code & 0x7F
-        
-        if idx >= len(codemap):
-            # Invalid index, just copy it
-            out_data.append(code)
-            out_data.append(val)
-            continue
-            
-        reg = codemap[idx]
-        ch = get_channel_from_reg(bank, reg)
-        
-        # ALWAYS keep global/rhythm control (0xBD)
-        if reg == 0xBD:
-             out_data.append(code)
-             out_data.append(val)
-             continue
-        
-        if ch == target_channel or ch == -1: # Keep target AND global settings (-1)
-            out_data.append(code)
-            out_data.append(val)
-        else:
-            dropped_commands += 1
-            # Skip
+# Events per column chunk gathered by iter_soa (filtered or dumped at a time)
+SOA_CHUNK_EVENTS = 32768
 
-    with open(output_filename, 'wb') as f_out:
-        f_out.write(out_data)
-        
-    print(f"Isolated Channel {target_channel}.")
-    print(f"Dropped {dropped_commands} other commands.")
-    print(f"Saved to {output_filename}")
+# Number of dump rows buffered between writes to stdout
+DUMP_BATCH_ROWS = 8192
 
-def dump_dro(filename):
+def read_dro(filename, copy=False):
+    """
+    Maps a DRO file into memory read-only. The mapping indexes and slices like
+    bytes and is released along with its last reference. Its pages come from
+    the page cache, so private memory stays small as long as callers read the
+    stream in windows (see iter_soa) rather than copying it whole.
+    With copy=True (or for an empty file, which cannot be mapped) the
+    contents are read into a bytes object instead.
+    """
     with open(filename, 'rb') as f:
-        data = f.read()
+        if copy or os.fstat(f.fileno()).st_size == 0:
+            return f.read()
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
 
+def parse_header(data):
+    """
+    Validates a DRO v2.0 header.
+    Returns (short_delay_code, long_delay_code, codemap, stream_start).
+    Raises DROError if the file is not supported.
+    """
     if data[0:8] != b'DBRAWOPL':
-        print("Error: Not a valid DRO file (missing magic 'DBRAWOPL')")
-        return
+        raise DROError("Not a valid DRO file (missing magic 'DBRAWOPL')")
+    
+    if len(data) < 26:
+        raise DROError("Truncated DRO header")
 
-    ver_major = struct.unpack('<H', data[8:10])[0]
-    ver_minor = struct.unpack('<H', data[10:12])[0]
+    # Little-endian 16-bit version fields
+    ver_major = data[8] | (data[9] << 8)
+    ver_minor = data[10] | (data[11] << 8)
     
     if ver_major != 2:
-        print(f"Error: This script only supports DRO v2.0 (Found v{ver_major}.{ver_minor})")
-        return
+        raise DROError(f"This script only supports DRO v2.0 (Found v{ver_major}.{ver_minor})")
 
     # DRO v2 Header Offsets
     # 12-15: Length Pairs
@@ -223,101 +149,360 @@ def dump_dro(filename):
     long_delay_code = data[24]
     codemap_len = data[25]
     
-    print(f"Header Info: ShortDelay=0x{short_delay_code:02X}, LongDelay=0x{long_delay_code:02X}, CodemapLen={codemap_len}")
-    
     codemap_start = 26
-    codemap = data[codemap_start : codemap_start + codemap_len]
+    if len(data) < codemap_start + codemap_len:
+        raise DROError(f"Truncated DRO codemap (expected {codemap_len} bytes, found {len(data) - codemap_start})")
+    
+    codemap = memoryview(data)[codemap_start : codemap_start + codemap_len]
     
     # Stream starts immediately after the codemap
-    i = codemap_start + codemap_len
-    time_accum = 0
+    stream_start = codemap_start + codemap_len
+    return short_delay_code, long_delay_code, codemap, stream_start
+
+def stream_bounds(data, stream_start):
+    """
+    Returns (stream_start, stream_end) for the whole events in the stream.
+    Delays and register writes are both two bytes, so anything from
+    stream_end onward is a trailing partial event.
+    """
+    # parse_header guarantees stream_start <= len(data); this only guards
+    # callers that skip it, where a negative length would round stream_end
+    # down into the header
+    stream_start = min(stream_start, len(data))
+    return stream_start, stream_start + ((len(data) - stream_start) & ~1)
+
+def iter_soa(data, stream_start):
+    """
+    Splits the event stream into columns, one entry per event, gathered
+    SOA_CHUNK_EVENTS events at a time so only one chunk's columns are held
+    in memory. Event starts are a fixed stride, so each column of a chunk
+    is a single strided slice of the input.
+    Yields dicts with 'offset' (range) and 'code' and 'val' (bytes).
+    """
+    stream_start, stream_end = stream_bounds(data, stream_start)
+    mv = memoryview(data)
+    step = 2 * SOA_CHUNK_EVENTS
+    
+    for start in range(stream_start, stream_end, step):
+        end = min(start + step, stream_end)
+        yield {
+            'offset': range(start, end, 2),
+            'code': mv[start:end:2].tobytes(),
+            'val': mv[start + 1:end:2].tobytes(),
+        }
+
+def iter_events(soa):
+    """
+    Returns an iterator of (offset, code, val) for each event in soa.
+    """
+    return zip(soa['offset'], soa['code'], soa['val'])
+
+def print_dump_header(short_delay_code, long_delay_code, codemap):
+    print(f"Header Info: ShortDelay=0x{short_delay_code:02X}, LongDelay=0x{long_delay_code:02X}, CodemapLen={len(codemap)}")
     
     print(f"{'OFFSET(h)':<10} | {'TIME(ms)':<8} | {'BNK':<3} | {'REG':<4} | {'VAL':<4} | {'DESC'}")
     print("-" * 70)
 
-    while i < len(data):
-        offset = i
-        code = data[i]
-        i += 1
-        
+def build_code_info(codemap):
+    """
+    Returns a per-code lookup for dump_events that folds the bank bit,
+    codemap and DESC_TABLE into one index:
+    code -> (BNK/REG columns, kind, prefix).
+    """
+    # In DRO v2:
+    # Bank = (Code >> 7) & 1  (0 or 1)
+    # Index = Code & 0x7F     (0-127)
+    # We look up the actual OPL Register in the Codemap
+    code_info = []
+    for code in range(256):
+        bank = (code >> 7) & 1
+        idx = code & 0x7F
+        if idx >= len(codemap):
+            # This shouldn't technically happen in a valid file unless codemap is short
+            code_info.append((f"{bank}   | {idx:02X}? ", DESC_STATIC, f"ERROR: Index {idx} out of bounds"))
+        else:
+            reg = codemap[idx]
+            code_info.append((f"{bank}   | {reg:02X}  ",) + DESC_TABLE[reg])
+    return code_info
+
+def dump_events(soa, code_info, short_delay_code, long_delay_code, time_accum=0):
+    """
+    Writes readable dump rows for the events in soa to stdout.
+    time_accum is the time (ms) before the first event; the time after the
+    last event is returned so chunked callers can carry it forward.
+    """
+    # Rows are written in batches rather than one print() per event
+    rows = []
+
+    for offset, code, val in iter_events(soa):
         # Check for Delay Codes
         if code == short_delay_code:
-            if i >= len(data): break
-            val = data[i]
-            i += 1
-            delay = val + 1
-            time_accum += delay
+            time_accum += val + 1
             continue
             
         elif code == long_delay_code:
-            if i >= len(data): break
-            val = data[i]
-            i += 1
-            delay = (val + 1) * 256
-            time_accum += delay
+            time_accum += (val + 1) * 256
             continue
         
         # If not a delay, it's a register write
-        # In DRO v2:
-        # Bank = (Code >> 7) & 1  (0 or 1)
-        # Index = Code & 0x7F     (0-127)
-        # We look up the actual OPL Register in the Codemap
-        
-        if i >= len(data): break
-        val = data[i] # The value to write to the register
-        i += 1
-        
-        bank = (code >> 7) & 1
-        idx = code & 0x7F
-        
-        if idx >= len(codemap):
-            # This shouldn't technically happen in a valid file unless codemap is short
-            desc = f"ERROR: Index {idx} out of bounds"
-            print(f"{offset:08X}   | {time_accum:<8} | {bank}   | {idx:02X}?  | {val:02X}   | {desc}")
-            continue
-
-        reg = codemap[idx]
+        if len(rows) >= DUMP_BATCH_ROWS:
+            sys.stdout.write("\n".join(rows) + "\n")
+            rows.clear()
         
         # Human Readable Description
-        desc = ""
+        cols, kind, prefix = code_info[code]
+        if kind == DESC_NONE:
+            continue
         
-        # B0-B8: KeyOn / Block / FreqHigh
-        if 0xB0 <= reg <= 0xB8:
-            ch = reg - 0xB0
+        if kind == DESC_KEYON:
             key_on = (val & 0x20) != 0
             block = (val & 0x1C) >> 2
             f_high = val & 0x03
-            desc = f"CH {ch} | KeyOn: {key_on} | Blk: {block} | F-Hi: {f_high}"
+            desc = f"{prefix} | KeyOn: {key_on} | Blk: {block} | F-Hi: {f_high}"
             if key_on:
                 desc += " <--- NOTE START"
-        
-        # A0-A8: FreqLow
-        elif 0xA0 <= reg <= 0xA8:
-            ch = reg - 0xA0
-            desc = f"CH {ch} | F-Low: {val}"
-            
-        # C0-C8: Feedback / Connection (Algorithm)
-        elif 0xC0 <= reg <= 0xC8:
-            ch = reg - 0xC0
+        elif kind == DESC_F_LOW:
+            desc = f"{prefix} | F-Low: {val}"
+        elif kind == DESC_CONN:
             fb = (val & 0x0E) >> 1
             cnt = val & 1
-            desc = f"CH {ch} | FB: {fb} | CNT: {cnt}"
-            
-        # 20-35: Tremolo / Vibrato / Sustain / KSR / Multiplier
-        elif 0x20 <= reg <= 0x35:
-            op_offset = reg - 0x20
-            desc = f"OP-Reg {reg:02X} | TVSKM"
-
-        # 40-55: KSL / Level
-        elif 0x40 <= reg <= 0x55:
-            desc = f"OP-Reg {reg:02X} | Level: {val & 0x3F}"
-            
-        # BD: Rhythm
-        elif reg == 0xBD:
-            desc = "Rhythm Control"
+            desc = f"{prefix} | FB: {fb} | CNT: {cnt}"
+        elif kind == DESC_LEVEL:
+            desc = f"{prefix} | Level: {val & 0x3F}"
+        else: # DESC_STATIC
+            desc = prefix
+
+        rows.append(f"{offset:08X}   | {time_accum:<8} | {cols} | {val:02X}   | {desc}")
+
+    if rows:
+        sys.stdout.write("\n".join(rows) + "\n")
+    return time_accum
+
+def discard_stdout():
+    """
+    Points stdout at os.devnull once its reader has gone away, so later
+    output is dropped instead of raising BrokenPipeError.
+    """
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, sys.stdout.fileno())
+    os.close(devnull)
+
+def start_dump(short_delay_code, long_delay_code, codemap):
+    """
+    Prints the dump header for a fused filter + dump pass. Returns the
+    dump_info for filter_stream, or None if stdout's reader is already gone.
+    """
+    try:
+        print_dump_header(short_delay_code, long_delay_code, codemap)
+    except BrokenPipeError:
+        discard_stdout()
+        return None
+    return build_code_info(codemap), short_delay_code, long_delay_code
 
-        if desc:
-            print(f"{offset:08X}   | {time_accum:<8} | {bank}   | {reg:02X}   | {val:02X}   | {desc}")
+@contextlib.contextmanager
+def open_output(output_filename, in_place):
+    """
+    Opens output_filename for binary writing. When it is also the input
+    (in_place), the data goes to a temporary file in the same directory that
+    replaces the input only once complete, so an interrupted run never leaves
+    the input partially written.
+    """
+    if not in_place:
+        with open(output_filename, 'wb') as f_out:
+            yield f_out
+        return
+    
+    fd, tmp_filename = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(output_filename)))
+    try:
+        with os.fdopen(fd, 'wb') as f_out:
+            yield f_out
+        shutil.copymode(output_filename, tmp_filename)
+        os.replace(tmp_filename, output_filename)
+    except BaseException:
+        os.unlink(tmp_filename)
+        raise
+
+def filter_stream(data, stream_start, keep, f_out, dump_info=None):
+    """
+    Filters the event stream that begins at stream_start, writing kept
+    events to f_out one iter_soa chunk at a time.
+    keep is a 256-entry table indexed by event code; events whose entry is 0
+    are dropped. If dump_info is given as (code_info, short_delay_code,
+    long_delay_code), the kept events are also dumped as they are written,
+    with offsets in the output file. Returns the dropped count.
+    """
+    stream_start, stream_end = stream_bounds(data, stream_start)
+    dropped = 0
+    out_offset = stream_start
+    time_accum = 0
+    
+    for soa in iter_soa(data, stream_start):
+        mask = soa['code'].translate(keep)
+        kept_codes = bytes(compress(soa['code'], mask))
+        kept_vals = bytes(compress(soa['val'], mask))
+        # Re-interleave the kept columns into (code, value) pairs
+        chunk = bytearray(2 * len(kept_codes))
+        chunk[0::2] = kept_codes
+        chunk[1::2] = kept_vals
+        f_out.write(chunk)
+        dropped += len(mask) - len(kept_codes)
+        
+        if dump_info is not None:
+            kept = {
+                'offset': range(out_offset, out_offset + len(chunk), 2),
+                'code': kept_codes,
+                'val': kept_vals,
+            }
+            try:
+                time_accum = dump_events(kept, *dump_info, time_accum)
+            except BrokenPipeError:
+                # The dump reader went away (e.g. piped to head); stop
+                # dumping but still finish writing the file
+                discard_stdout()
+                dump_info = None
+        out_offset += len(chunk)
+    
+    # Trailing partial event, if any, is copied unchanged
+    f_out.write(memoryview(data)[stream_end:])
+    return dropped
+
+def remove_channel(filename, target_channel, output_filename, dump=False):
+    # Writing over a mapped input would truncate it under us
+    in_place = os.path.exists(output_filename) and os.path.samefile(filename, output_filename)
+    data = read_dro(filename, copy=in_place)
+
+    short_delay_code, long_delay_code, codemap, stream_start = parse_header(data)
+    
+    # Every DRO v2 event is a (code, value) byte pair, delays included, so
+    # the keep/drop decision depends only on the code byte. Build a table
+    # of that decision per code, then filter the pairs in bulk.
+    target_p1 = target_channel + 1
+    keep = bytearray(256)
+    for code in range(256):
+        idx = code & 0x7F
+        if code == short_delay_code or code == long_delay_code:
+            keep[code] = 1 # Delay Codes - Copy unchanged
+        elif idx >= len(codemap):
+            keep[code] = 1 # Invalid index, just copy it to be safe
+        else:
+            # Bank bit lives in the top bit of the code
+            keep[code] = CH_LUT[((code & 0x80) << 1) | codemap[idx]] != target_p1
+    
+    with open_output(output_filename, in_place) as f_out:
+        # Optionally dump the output in the same pass (header only once the
+        # output file is known to be writable)
+        dump_info = None
+        if dump:
+            dump_info = start_dump(short_delay_code, long_delay_code, codemap)
+        # 1. Copy Header and Codemap verbatim
+        f_out.write(memoryview(data)[:stream_start])
+        # 2. Write the filtered stream
+        dropped_commands = filter_stream(data, stream_start, keep, f_out, dump_info)
+        
+    print(f"Removed Channel {target_channel}.")
+    print(f"Dropped {dropped_commands} commands.")
+    print(f"Saved to {output_filename}")
+
+def isolate_channel(filename, target_channel, output_filename, dump=False):
+    # Writing over a mapped input would truncate it under us
+    in_place = os.path.exists(output_filename) and os.path.samefile(filename, output_filename)
+    data = read_dro(filename, copy=in_place)
+
+    short_delay_code, long_delay_code, codemap, stream_start = parse_header(data)
+    
+    # Same per-code keep table as remove_channel, inverted for isolation.
+    target_p1 = target_channel + 1
+    keep = bytearray(256)
+    for code in range(256):
+        idx = code & 0x7F
+        if code == short_delay_code or code == long_delay_code:
+            keep[code] = 1 # Delay Codes - Copy unchanged
+        elif idx >= len(codemap):
+            keep[code] = 1 # Invalid index, just copy it
+        else:
+            # Keep target AND global settings (0), which include
+            # global/rhythm control (0xBD)
+            ch_p1 = CH_LUT[((code & 0x80) << 1) | codemap[idx]]
+            keep[code] = ch_p1 == target_p1 or ch_p1 == 0
+    
+    with open_output(output_filename, in_place) as f_out:
+        # Optionally dump the output in the same pass (header only once the
+        # output file is known to be writable)
+        dump_info = None
+        if dump:
+            dump_info = start_dump(short_delay_code, long_delay_code, codemap)
+        # 1. Copy Header and Codemap verbatim
+        f_out.write(memoryview(data)[:stream_start])
+        # 2. Write the filtered stream
+        dropped_commands = filter_stream(data, stream_start, keep, f_out, dump_info)
+        
+    print(f"Isolated Channel {target_channel}.")
+    print(f"Dropped {dropped_commands} other commands.")
+    print(f"Saved to {output_filename}")
+
+def dump_dro(filename):
+    data = read_dro(filename)
+
+    short_delay_code, long_delay_code, codemap, stream_start = parse_header(data)
+    
+    print_dump_header(short_delay_code, long_delay_code, codemap)
+    code_info = build_code_info(codemap)
+    time_accum = 0
+    for soa in iter_soa(data, stream_start):
+        time_accum = dump_events(soa, code_info, short_delay_code, long_delay_code, time_accum)
+
+def _run_captured(func, filename, target_channel, output_filename):
+    """
+    Runs one batch job in a worker, returning (printed output, error) so the
+    parent can print each file's report in one piece. error is None on
+    success, else the message of the DROError or OSError (e.g. a missing
+    input) that stopped this file.
+    """
+    buf = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(buf):
+            func(filename, target_channel, output_filename)
+    except (DROError, OSError) as e:
+        return buf.getvalue(), str(e)
+    return buf.getvalue(), None
+
+def batch_process(func, filenames, target_channel, output_dir):
+    """
+    Runs func (remove_channel or isolate_channel) over many files in
+    parallel, one worker process per CPU. Each result is saved in
+    output_dir under the input's file name, so inputs sharing a file name
+    are rejected before anything is processed.
+    Returns the number of files that failed (or collided); a failing file
+    does not stop the others.
+    """
+    # Imported here: the process pool machinery costs tens of milliseconds
+    # to import, which single-file commands should not pay
+    from concurrent.futures import ProcessPoolExecutor
+    
+    # Inputs that would be saved under the same output name
+    by_name = {}
+    for fn in filenames:
+        by_name.setdefault(os.path.basename(fn), []).append(fn)
+    collisions = [fns for fns in by_name.values() if len(fns) > 1]
+    if collisions:
+        for fns in collisions:
+            print(f"Error: {', '.join(fns)} would all be saved as "
+                  f"{os.path.join(output_dir, os.path.basename(fns[0]))}")
+        return sum(len(fns) for fns in collisions)
+    
+    os.makedirs(output_dir, exist_ok=True)
+    output_filenames = [os.path.join(output_dir, os.path.basename(fn)) for fn in filenames]
+    failed = 0
+    
+    with ProcessPoolExecutor(max_workers=os.cpu_count()) as executor:
+        results = executor.map(_run_captured, repeat(func), filenames,
+                               repeat(target_channel), output_filenames)
+        for filename, (report, error) in zip(filenames, results):
+            sys.stdout.write(report)
+            if error is not None:
+                print(f"Error: {filename}: {error}")
+                failed += 1
+    return failed
 
 def calc_shift(hex_a0, hex_b0, semitones):
     # hex_a0 is the value at register A0-A8 (F-Num Low)
@@ -337,16 +522,18 @@ def calc_shift(hex_a0, hex_b0, semitones):
     # Formula: F_new = F_old * 2^(semitones/12)
     multiplier = 2 ** (semitones / 12.0)
     new_f_num = int(current_f_num * multiplier)
-    new_block = block
     
     # 3. Handle Block Overflow/Underflow
     # OPL F-Num must be < 1024. If it goes over, increase octave (Block).
-    while new_f_num >= 1024 and new_block < 7:
-        new_f_num //= 2
-        new_block += 1
-    while new_f_num < 512 and new_block > 0: # Normalize
-        new_f_num *= 2
-        new_block -= 1
+    # Otherwise normalize up into [512, 1024) while the block allows it.
+    # The top bit of a normalized F-Num is bit 9, so bit_length() - 10 is
+    # the number of octaves to move, clamped to the blocks available.
+    shift = max(-block, min(new_f_num.bit_length() - 10, 7 - block))
+    new_block = block + shift
+    if shift > 0:
+        new_f_num >>= shift
+    else:
+        new_f_num <<= -shift
         
     print(f"New      -> Block: {new_block}, F-Num: {new_f_num}")
     
@@ -364,10 +551,13 @@ if __name__ == "__main__":
     def show_help():
         print("Usage: python3 dro_surgeon.py <command> [args]")
         print("\nCommands:")
-        print("  dump    <file.dro>                        Dump readable event stream")
-        print("  remove  <in.dro> <ch_num> <out.dro>       Remove a specific channel (0-17)")
-        print("  isolate <in.dro> <ch_num> <out.dro>       Keep ONLY a specific channel (0-17)")
-        print("  calc    <HexA0> <HexB0> <Semitones>       Calculate register values for pitch shift")
+        print("  dump          <file.dro>                        Dump readable event stream")
+        print("  remove        <in.dro> <ch_num> <out.dro>       Remove a specific channel (0-17)")
+        print("  isolate       <in.dro> <ch_num> <out.dro>       Keep ONLY a specific channel (0-17)")
+        print("                [--dump]                          (remove/isolate) Also dump the output events")
+        print("  batch-remove  <ch_num> <out_dir> <in.dro>...    Remove a channel from many files in parallel")
+        print("  batch-isolate <ch_num> <out_dir> <in.dro>...    Isolate a channel in many files in parallel")
+        print("  calc          <HexA0> <HexB0> <Semitones>       Calculate register values for pitch shift")
         print("\nExample:")
         print("  python3 dro_surgeon.py isolate song.dro 5 isolated.dro")
 
@@ -375,22 +565,52 @@ if __name__ == "__main__":
         show_help()
         sys.exit(0)
 
-    if sys.argv[1] == "dump":
-        dump_dro(sys.argv[2])
-    elif sys.argv[1] == "remove":
-        # python3 dro_surgeon.py remove input.dro 5 output.dro
-        if len(sys.argv) < 5:
-            print("Error: Missing arguments for remove")
-            sys.exit(1)
-        remove_channel(sys.argv[2], int(sys.argv[3]), sys.argv[4])
-    elif sys.argv[1] == "isolate":
-        if len(sys.argv) < 5:
-            print("Error: Missing arguments for isolate")
+    # --dump makes remove/isolate dump their output in the same pass
+    dump = "--dump" in sys.argv[2:]
+    if dump:
+        if sys.argv[1] not in ("remove", "isolate"):
+            print(f"Error: --dump is only supported by remove and isolate, not {sys.argv[1]}")
             sys.exit(1)
-        isolate_channel(sys.argv[2], int(sys.argv[3]), sys.argv[4])
-    elif sys.argv[1] == "calc":
-        # Input format: python script.py calc E2 31 -2
-        a0 = int(sys.argv[2], 16)
-        b0 = int(sys.argv[3], 16)
-        semi = float(sys.argv[4])
-        calc_shift(a0, b0, semi)
\ No newline at end of file
+        sys.argv = sys.argv[:2] + [arg for arg in sys.argv[2:] if arg != "--dump"]
+
+    if sys.argv[1] == "dump":
+        # Handle broken pipes (e.g., when piping to head). Not for --dump:
+        # being killed there would leave the output file half written.
+        signal.signal(signal.SIGPIPE, signal.SIG_DFL)
+
+    try:
+        if sys.argv[1] == "dump":
+            dump_dro(sys.argv[2])
+        elif sys.argv[1] == "remove":
+            # python3 dro_surgeon.py remove input.dro 5 output.dro
+            if len(sys.argv) < 5:
+                print("Error: Missing arguments for remove")
+                sys.exit(1)
+            remove_channel(sys.argv[2], int(sys.argv[3]), sys.argv[4], dump)
+        elif sys.argv[1] == "isolate":
+            if len(sys.argv) < 5:
+                print("Error: Missing arguments for isolate")
+                sys.exit(1)
+            isolate_channel(sys.argv[2], int(sys.argv[3]), sys.argv[4], dump)
+        elif sys.argv[1] in ("batch-remove", "batch-isolate"):
+            # python3 dro_surgeon.py batch-remove 5 out_dir song1.dro song2.dro
+            if len(sys.argv) < 5:
+                print(f"Error: Missing arguments for {sys.argv[1]}")
+                sys.exit(1)
+            func = remove_channel if sys.argv[1] == "batch-remove" else isolate_channel
+            if batch_process(func, sys.argv[4:], int(sys.argv[2]), sys.argv[3]):
+                sys.exit(1)
+        elif sys.argv[1] == "calc":
+            # Input format: python script.py calc E2 31 -2
+            a0 = int(sys.argv[2], 16)
+            b0 = int(sys.argv[3], 16)
+            semi = float(sys.argv[4])
+            calc_shift(a0, b0, semi)
+    except DROError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    except BrokenPipeError:
+        # Reader went away after the output file was finished (e.g. during
+        # the summary of remove/isolate --dump piped to head)
+        discard_stdout()
+        sys.exit(1)